@@ -3,18 +3,231 @@ Library to make connecting to a NREMC database and running commands simpler
 
 Classes:
     NREMCDatabaseConnector
-    
+    NREMCDatabaseConnectorPool
+
 Misc Types:
     Commands
 """
 
+import functools
+import keyword
+import os
+import re
+import sys
+import threading
+import time
+import types
+import uuid
+import weakref
 import pyodbc
-import tomli
-from pyodbc import Cursor, Row
-from typing import Any, Optional, Literal
+from collections import deque
+from contextlib import contextmanager
+from decimal import Decimal
+from pyodbc import Connection, Cursor, Row
+from typing import Any, Iterable, Iterator, Optional, Literal, Sequence, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pyarrow
 
 Commands = dict[str, str]
 
+# Finds the '(?, ?, ...)' row in a 'INSERT ... VALUES (?, ?, ...)' command
+_INSERT_VALUES = re.compile(
+    r"^\s*INSERT\b.*?\bVALUES\s*(\((?:[^()']|'[^']*')*\))\s*;?\s*$",
+    re.IGNORECASE | re.DOTALL,
+)
+
+# SQL Server caps a single request at 2100 parameters and a VALUES list at 1000 rows
+_MAX_INSERT_ROWS = 1000
+
+# Parsed toml files keyed by path along with the modification time they were parsed at
+_toml_cache: dict[str, tuple[float, dict[str, Any]]] = {}
+
+# Connection strings already built keyed by (server, database, version)
+_conn_str_cache: dict[tuple[str, str, int], str] = {}
+
+# Names of the installed ODBC drivers, looked up the first time a connection string is built
+_available_drivers: Optional[list[str]] = None
+
+_DRIVER_NAME = re.compile(r"ODBC Driver (\d+) for SQL Server", re.IGNORECASE)
+
+# ODBC connection attribute for the network packet size, pyodbc has no constant for it
+_SQL_ATTR_PACKET_SIZE = 112
+
+# Let the ODBC driver manager reuse connections that have been closed instead of
+# paying the full login handshake again, must be set before the first connect
+pyodbc.pooling = True
+
+
+def _pick_driver(version: int) -> str:
+    """Picks the newest installed SQL Server ODBC driver that is not newer than 'version'
+
+    The installed drivers are only looked up once per process
+
+    Args:
+        version (int): Pyodbc driver version asked for
+
+    Returns:
+        str: Name of the driver to use, the requested version if no matching driver is installed
+    """
+    global _available_drivers
+    if _available_drivers is None:
+        _available_drivers = pyodbc.drivers()
+
+    installed = {}
+    for name in _available_drivers:
+        match = _DRIVER_NAME.fullmatch(name)
+        if match and int(match.group(1)) <= version:
+            installed[int(match.group(1))] = name
+    if not installed:
+        return f"ODBC DRIVER {version} for SQL Server"
+    return installed[max(installed)]
+
+
+def _build_conn_str(server: str, database: str, version: int) -> str:
+    """Builds the ODBC connection string for a SQL Server database, reusing ones already built
+
+    Args:
+        server (str): Name of server to connect to
+        database (str): Name of database to connect to
+        version (int): Pyodbc driver version to use, an older installed driver is used if it is missing
+
+    Returns:
+        str: Connection string to pass to pyodbc
+    """
+    key = (server, database, version)
+    conn_str = _conn_str_cache.get(key)
+    if conn_str is None:
+        conn_str = (
+            f"Driver={{{_pick_driver(version)}}};"
+            f"SERVER={server};DATABASE={database};ENCRYPT=no;"
+            f"Trusted_Connection=yes"
+        )
+        _conn_str_cache[key] = conn_str
+    return conn_str
+
+
+def _connect(conn_str: str, packet_size: int, autocommit: bool) -> Connection:
+    """Opens a connection setting the packet size before the driver opens its socket
+
+    Bigger packets mean fewer round trips on slow links but some drivers get
+    slower with very large buffers, so the size is left configurable
+
+    Args:
+        conn_str (str): Connection string to pass to pyodbc
+        packet_size (int): Network packet size in bytes, SQL Server allows 512 to 32767
+        autocommit (bool): Whether every statement is committed as soon as it runs
+
+    Returns:
+        Connection: Open connection to the sql server
+    """
+    return pyodbc.connect(
+        conn_str,
+        autocommit=autocommit,
+        attrs_before={_SQL_ATTR_PACKET_SIZE: packet_size},
+    )
+
+
+@functools.lru_cache(maxsize=256)
+def _markers(n: int) -> str:
+    """Builds the parameter markers for 'n' values
+
+    Args:
+        n (int): Number of values
+
+    Returns:
+        str: 'n' markers like '?, ?, ?'
+    """
+    return ", ".join(["?"] * n)
+
+
+@functools.lru_cache(maxsize=256)
+def _values_row(n: int) -> str:
+    """Builds a VALUES row of parameter markers for 'n' values
+
+    Args:
+        n (int): Number of values
+
+    Returns:
+        str: 'n' markers in brackets like '(?, ?, ?)'
+    """
+    return f"({_markers(n)})"
+
+
+def _arrow_param(arg: Any) -> Optional[str]:
+    """Turns a parameter into the text arrow-odbc sends to the server
+
+    Only types with one clear text form are accepted so the server reads the value back the same way
+
+    Args:
+        arg (Any): Parameter to convert, one of None, str, bool, int or a finite Decimal
+
+    Raises:
+        TypeError: If the parameter is some other type
+        ValueError: If the parameter is a NaN or infinite Decimal
+
+    Returns:
+        Optional[str]: Text form of the parameter, None for NULL
+    """
+    if arg is None or isinstance(arg, str):
+        return arg
+    if isinstance(arg, bool):
+        return "1" if arg else "0"
+    if isinstance(arg, int):
+        return str(arg)
+    if isinstance(arg, Decimal):
+        if not arg.is_finite():
+            raise ValueError(f"call_arrow can't send the Decimal {arg} to the server")
+        return format(arg, "f")
+    raise TypeError(
+        f"call_arrow only takes None, str, bool, int or Decimal parameters not {type(arg).__name__}"
+    )
+
+
+def _close_handles(crsr: Cursor, conn: Optional[Connection]) -> None:
+    """Closes a cursor and its connection ignoring errors from handles that are already dead
+
+    Args:
+        crsr (Cursor): Cursor to close
+        conn (Optional[Connection]): Connection to close, None if it belongs to someone else
+    """
+    for handle in (crsr, conn):
+        if handle is None:
+            continue
+        try:
+            handle.close()
+        except pyodbc.Error:
+            pass
+
+
+def _load_toml(f_loc: str) -> dict[str, Any]:
+    """Loads a toml file, only importing a toml parser the first time one is needed
+
+    Uses the standard library 'tomllib' on Python 3.11+ and 'tomli' before that.
+    The parsed file is cached and only parsed again once its modification time changes
+
+    Args:
+        f_loc (str): Location of the toml file to load in
+
+    Returns:
+        dict[str, Any]: Parsed contents of the toml file, shared with the cache so it must not be modified
+    """
+    path = os.path.abspath(f_loc)
+    mtime = os.stat(path).st_mtime
+    cached = _toml_cache.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    if sys.version_info >= (3, 11):
+        import tomllib
+    else:
+        import tomli as tomllib
+
+    with open(path, "rb") as f:
+        config = tomllib.load(f)
+    _toml_cache[path] = (mtime, config)
+    return config
+
 
 class NREMCDatabaseConnector(object):
     """Class that creates and maintains a database connection with pyodbc.
@@ -23,9 +236,15 @@ class NREMCDatabaseConnector(object):
     commands and retrieve information, insert data, update data, or delete data
 
     Attributes:
+        _conn_str (str): Connection string for the sql database
         _conn (Connection): Pyodbc connection to the sql database
         _crsr (Cursor): Pyodbc cursor to execute sql code on the server
         _cmds (Commands): Dictionary of command identifiers to predefined sql commands
+        _finalizer (weakref.finalize): Closes the cursor and owned connection when called or garbage collected
+        _row_buf (deque[Row]): Rows read ahead by 'fetch()' that haven't been returned yet
+        _prefetch (int): How many rows 'fetch()' reads ahead per round trip
+        _buf_description (Optional[tuple]): Cursor description of the query the buffered rows came from
+        _stmt_cache (dict[tuple, str]): Generated sql for each command and column layout already seen
     """
 
     def __init__(
@@ -33,33 +252,78 @@ class NREMCDatabaseConnector(object):
         server: str = ".",
         database: str = "master",
         version: int = 17,
-        cmds: Commands = {},
+        cmds: Optional[Commands] = None,
+        conn: Optional[Connection] = None,
+        packet_size: int = 32767,
+        arraysize: int = 1000,
+        autocommit: bool = False,
+        prefetch_rows: int = 100,
     ) -> None:
         """Creates a connection to the sql server
 
         Takes in the servers name which database to connect too and the ODBC driver version to use
         Additionally takes in a dict with all command identifiers and predefined commands to execute
 
+        If an already open connection is passed in it is used instead of opening a new one
+        and it is left open when this object is closed so it can be handed back to a pool,
+        the server, database and version should still describe where it is connected to
+
         Args:
             server (str, optional): Name of server to connect to. Defaults to ".".
             database (str, optional): Name of database to connect to. Defaults to "master".
             version (int, optional): Pyodbc driver version to use. Defaults to 17.
-            cmds (Commands, optional): Dictionary of commands to use. Defaults to {}.
+            cmds (Optional[Commands], optional): Dictionary of commands to use, it is copied. Defaults to None.
+            conn (Optional[Connection], optional): Open connection to use instead of creating one. Defaults to None.
+            packet_size (int, optional): Network packet size in bytes for new connections. Defaults to 32767.
+            arraysize (int, optional): Default batch size for 'fetchmany', 'fetch_batches' and 'fetch_iter', it doesn't change how many rows the driver reads per network round trip. Defaults to 1000.
+            autocommit (bool, optional): Commit every statement as soon as it runs on new connections. Defaults to False.
+            prefetch_rows (int, optional): How many rows 'fetch()' reads ahead per round trip. Defaults to 100.
+
+        Raises:
+            ValueError: If 'prefetch_rows' is less than one
         """
-        conn_str = (
-            f"Driver={{ODBC DRIVER {version} for SQL Server}};"
-            f"SERVER={server};DATABASE={database};ENCRYPT=no;"
-            f"Trusted_Connection=yes"
+        if prefetch_rows < 1:
+            raise ValueError(f"prefetch_rows must be at least 1 not {prefetch_rows}")
+        self._conn_str = _build_conn_str(server, database, version)
+        self._owns_conn = conn is None
+        if conn is None:
+            conn = _connect(self._conn_str, packet_size, autocommit)
+        self._conn = conn
+        try:
+            self._crsr = self._conn.cursor()
+        except Exception:
+            if self._owns_conn:
+                self._conn.close()
+            raise
+        self._finalizer = weakref.finalize(
+            self, _close_handles, self._crsr, self._conn if self._owns_conn else None
         )
-        self._conn = pyodbc.connect(conn_str)
-        self._crsr = self._conn.cursor()
         self._crsr.fast_executemany = True
-        self._cmds = cmds
-
-    def __del__(self):
-        """Destructor to close all connections"""
-        self._crsr.close()
-        self._conn.close()
+        self._crsr.arraysize = arraysize
+        self._row_buf: deque[Row] = deque()
+        self._prefetch = prefetch_rows
+        self._buf_description: Optional[tuple] = None
+        self._cmds: Commands = {}
+        for identifier, command in (cmds or {}).items():
+            self.set_command(identifier, command)
+        self._stmt_cache: dict[tuple, str] = {}
+
+    def __enter__(self) -> "NREMCDatabaseConnector":
+        """Lets the connector be used in a with block that closes it at the end"""
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        """Closes the connector when the with block exits"""
+        self.close()
+
+    def close(self) -> None:
+        """Closes the cursor and the connection unless the connection was passed in
+
+        This also happens automatically once the object is garbage collected
+        """
+        finalizer = getattr(self, "_finalizer", None)
+        if finalizer is not None:
+            finalizer()
 
     @staticmethod
     def from_toml_config(
@@ -77,8 +341,7 @@ class NREMCDatabaseConnector(object):
         Returns:
             NREMCDatabaseConnector (NREMCDatabaseConnector): Live connection to database defined in the config file
         """
-        with open(f_loc, "rb") as f:
-            config = tomli.load(f)
+        config = _load_toml(f_loc)
 
         server_config = config[server_header]
 
@@ -94,6 +357,11 @@ class NREMCDatabaseConnector(object):
         """Cursor: Returns a cursor connected to the SQL server"""
         return self._crsr
 
+    @property
+    def commands(self) -> types.MappingProxyType[str, str]:
+        """MappingProxyType[str, str]: Returns a read only view of the stored commands"""
+        return types.MappingProxyType(self._cmds)
+
     def call(self, cmd: str, *args) -> Cursor:
         """Executes a predefined sql command
 
@@ -107,20 +375,172 @@ class NREMCDatabaseConnector(object):
         Returns:
             Cursor: Returns a cursor connection to the server after the command is executed
         """
+        self._row_buf.clear()
         return self._crsr.execute(self._cmds[cmd], *args)
 
-    def call_many(self, cmd: str, *args) -> None:
+    def call_arrow(self, cmd: str, *args, batch_size: int = 10000) -> "pyarrow.Table":
+        """Executes a predefined sql command and reads the results straight into a pyarrow Table
+
+        The rows are fetched in column batches by arrow-odbc instead of being turned into
+        Row objects one at a time, which is much faster for wide or numeric heavy results.
+        arrow-odbc opens its own connection so the command does not see uncommitted changes
+        made through this connector. Needs the optional 'arrow-odbc' and 'pyarrow' packages
+
+        Args:
+            cmd (str): Command identifier to tell the connection which command to run
+            *args (tuple[Any]): Arguments to pass to the command, they are sent as text so only None, str, bool, int and Decimal are accepted
+            batch_size (int, optional): How many rows to fetch per batch. Defaults to 10000.
+
+        Raises:
+            ImportError: If 'arrow-odbc' or 'pyarrow' is not installed
+            TypeError: If an argument is not None, str, bool, int or Decimal
+            ValueError: If an argument is a NaN or infinite Decimal
+
+        Returns:
+            pyarrow.Table: All rows retrieved by the SQL command
+        """
+        parameters = [_arrow_param(arg) for arg in args]
+        try:
+            import pyarrow
+            from arrow_odbc import read_arrow_batches_from_odbc
+        except ImportError as e:
+            raise ImportError(
+                "call_arrow needs the optional 'arrow-odbc' and 'pyarrow' packages"
+            ) from e
+
+        reader = read_arrow_batches_from_odbc(
+            query=self._cmds[cmd],
+            connection_string=self._conn_str,
+            batch_size=batch_size,
+            parameters=parameters,
+        )
+        return pyarrow.Table.from_batches(reader, schema=reader.schema)
+
+    def call_many(self, cmd: str, *args, batch_size: int = 1000) -> None:
         """Executes a predefined sql command many times.
 
+        The parameter sets are sent to the server 'batch_size' rows at a time so
+        very large sequences don't end up in one huge request
+
         Args:
             cmd (str): Command identifier to tell the connection which command to run.
-            *args (tuple[Any]): Arguments to pass to the command.
+            *args (tuple[Any]): Arguments to pass to the command, the first being a sequence of parameter sets.
+            batch_size (int, optional): How many parameter sets to send per round trip. Defaults to 1000.
+
+        Raises:
+            ValueError: If 'batch_size' is less than one
+        """
+        self._executemany(self._cmds[cmd], args[0], batch_size)
+
+    def _executemany(
+        self, query: str, seq: Iterable[Sequence[Any]], batch_size: int
+    ) -> None:
+        """Runs executemany on the cursor sending 'batch_size' parameter sets at a time
+
+        Args:
+            query (str): SQL to execute for every parameter set
+            seq (Iterable[Sequence[Any]]): Parameter sets to execute the query with
+            batch_size (int): How many parameter sets to send per round trip
+
+        Raises:
+            ValueError: If 'batch_size' is less than one
+        """
+        if batch_size < 1:
+            raise ValueError(f"batch_size must be at least 1 not {batch_size}")
+        seq = list(seq)
+        self._row_buf.clear()
+        for i in range(0, len(seq), batch_size):
+            self._crsr.executemany(query, seq[i : i + batch_size])
+
+    def bulk_insert(
+        self,
+        table: str,
+        columns: Sequence[str],
+        rows: Iterable[Sequence[Any]],
+        batch_size: int = 1000,
+    ) -> int:
+        """Inserts a very large number of rows into a table through a staging table
+
+        The rows are loaded into an empty global temp table with the same columns, which has
+        no indexes, constraints or triggers to maintain, and then moved into 'table' with a
+        single 'INSERT ... SELECT'. The staging table is always dropped afterwards, if
+        something fails the original error is raised even if dropping the table fails too.
+        The staging table is made with 'SELECT TOP 0 ... INTO' which copies IDENTITY
+        properties, so passing an identity column in 'columns' fails
+
+        Args:
+            table (str): Name of the table to insert into
+            columns (Sequence[str]): Columns to fill, in the same order as the values in each row
+            rows (Iterable[Sequence[Any]]): Values for each row to insert
+            batch_size (int, optional): How many rows to send to the staging table per round trip. Defaults to 1000.
+
+        Returns:
+            int: Number of rows inserted into 'table'
+        """
+        cols = ", ".join(columns)
+        # A global temp table so the driver can describe its parameters from another scope
+        stage = f"##nremc_stage_{uuid.uuid4().hex}"
+
+        self._row_buf.clear()
+        self._crsr.execute(f"SELECT TOP 0 {cols} INTO {stage} FROM {table}")
+        try:
+            self._executemany(
+                f"INSERT INTO {stage} ({cols}) VALUES {_values_row(len(columns))}",
+                rows,
+                batch_size,
+            )
+            self._crsr.execute(f"INSERT INTO {table} ({cols}) SELECT {cols} FROM {stage}")
+            inserted = self._crsr.rowcount
+        except BaseException:
+            # A rolled back transaction or dropped connection may have already taken the
+            # staging table with it, don't let cleaning up hide the original error
+            try:
+                self._crsr.execute(f"DROP TABLE IF EXISTS {stage}")
+            except pyodbc.Error:
+                pass
+            raise
+        self._crsr.execute(f"DROP TABLE IF EXISTS {stage}")
+        return inserted
+
+    def insert_many(
+        self, cmd: str, rows: Sequence[Sequence[Any]], max_params: int = 2000
+    ) -> None:
+        """Inserts many rows at once by sending a single multi row 'INSERT ... VALUES (?, ?), (?, ?), ...'
+
+        The VALUES row of the command is repeated for as many rows as fit under
+        'max_params' parameters so each chunk only takes one round trip.
+        Commands that are not a 'INSERT ... VALUES (...)' are run with 'call_many' instead
+
+        Args:
+            cmd (str): Command identifier to tell the connection which command to run
+            rows (Sequence[Sequence[Any]]): Values for each row to insert
+            max_params (int, optional): Most parameters to send in one request, SQL Server allows 2100. Defaults to 2000.
         """
-        self._crsr.executemany(self._cmds[cmd], *args)
+        query = self._cmds[cmd]
+        match = _INSERT_VALUES.match(query)
+        n_cols = match.group(1).count("?") if match else 0
+        if n_cols == 0:
+            self.call_many(cmd, rows)
+            return
+
+        rows = list(rows)
+        self._row_buf.clear()
+        prefix = query[: match.start(1)]
+        suffix = query[match.end(1) :]
+        values_row = match.group(1)
+        rows_per_batch = max(1, min(_MAX_INSERT_ROWS, max_params // n_cols))
+
+        for i in range(0, len(rows), rows_per_batch):
+            batch = rows[i : i + rows_per_batch]
+            batch_query = prefix + ", ".join([values_row] * len(batch)) + suffix
+            params = tuple(val for row in batch for val in row)
+            self._crsr.execute(batch_query, params)
 
     def fill_insert(self, cmd: str, keys_and_values: dict[Any, Any]) -> Cursor:
         """Fills a insert command by taking the keys from 'keys_and_values' and setting them as the columns and the values from 'keys_and_values' and executing the query with those values
-        
+
+        The columns are sorted so the same set of columns always produces the same sql no matter the dict order
+
         Args:
             cmd (str): Command identifier to tell the connection which command to run
             keys_and_values (dict[Any, Any]): Dict of the columns you want to insert into and values to place into those columns
@@ -128,48 +548,79 @@ class NREMCDatabaseConnector(object):
         Returns:
             Cursor: Returns a cursor connection to the server after the command is executed
         """
-        query = self._cmds[cmd].format(
-            ", ".join(keys_and_values.keys()),
-            ", ".join(["?"] * len(keys_and_values))
-        )
-        values = tuple(keys_and_values.values())
+        template = self._cmds[cmd]
+        keys = tuple(sorted(keys_and_values))
+
+        cache_key = ("INSERT", template, keys)
+        query = self._stmt_cache.get(cache_key)
+        if query is None:
+            query = template.format(", ".join(keys), _markers(len(keys)))
+            self._stmt_cache[cache_key] = query
+
+        values = tuple(keys_and_values[key] for key in keys)
+        self._row_buf.clear()
         return self._crsr.execute(query, values)
         
     def fill_update(self, cmd: str, keys_and_values: dict[Any, Any], conditional_keys: list[Any], conditional_connectors: Optional[list[Literal["AND", "OR"]]] = None) -> Cursor:
         """Fills a update command by using a dict and taking its keys as columns to update and search by and its values as new values or search values
 
+        The columns to update are sorted so the same set of columns always produces the same sql no matter the dict order
+
         Args:
             cmd (str): Command identifier to tell the connection which command to run
             keys_and_values (dict[Any, Any]): Dict of the columns you wan to update and or search and values associated with  those columns
             conditional_keys (list[Any]): Keys in the dict that are meant to go in the where close
             conditional_connectors (Optional[list[Literal[&quot;AND&quot;, &quot;OR&quot;]]], optional): If two conditional keys are given they need a connector either 'AND' or 'OR'. Defaults to None.
 
+        Raises:
+            ValueError: If there are no conditional keys, nothing left to update or the connectors don't match up with the conditional keys
+
         Returns:
             Cursor: Returns a cursor connection to the server after the command is executed
         """
-        update_query = self._cmds[cmd]
-        vals = []
-        
-        for key, val in keys_and_values.items():
-            if key not in conditional_keys:
-                update_query += f"{key} = ?, "
-                vals.append(val)
-        
-        cond_vals = []
-        
-        conds = list(zip(conditional_keys, conditional_connectors + [""]))
-        update_query = update_query.rstrip(", ") + "WHERE = "
-        for cond, connector in conds:
-            update_query += cond + " = ?" + connector + ", "
-            cond_vals.append(keys_and_values[cond])
-        update_query = update_query.rstrip(", ")
-        
-        return self._crsr.execute(update_query, vals.extend(cond_vals))
-        
+        conditional_connectors = conditional_connectors or []
+        if not conditional_keys:
+            raise ValueError("fill_update needs at least one conditional key")
+        if len(conditional_connectors) != len(conditional_keys) - 1:
+            raise ValueError(
+                f"{len(conditional_keys)} conditional keys need {len(conditional_keys) - 1} connectors "
+                f"but {len(conditional_connectors)} were given"
+            )
+        connectors = tuple(connector.upper() for connector in conditional_connectors)
+        if any(connector not in ("AND", "OR") for connector in connectors):
+            raise ValueError(f"Conditional connectors must be 'AND' or 'OR' not {conditional_connectors}")
+
+        update_keys = tuple(sorted(key for key in keys_and_values if key not in conditional_keys))
+        if not update_keys:
+            raise ValueError("fill_update needs at least one key to update that isn't a conditional key")
+
+        template = self._cmds[cmd]
+        cond_keys = tuple(conditional_keys)
+
+        cache_key = ("UPDATE", template, update_keys, cond_keys, connectors)
+        update_query = self._stmt_cache.get(cache_key)
+        if update_query is None:
+            base = template.rstrip()
+            if not re.search(r"\bSET$", base, re.IGNORECASE):
+                base += " SET"
+            set_clause = ", ".join(f"{key} = ?" for key in update_keys)
+            where_clause = f" WHERE {cond_keys[0]} = ?" + "".join(
+                f" {connector} {cond} = ?" for connector, cond in zip(connectors, cond_keys[1:])
+            )
+            update_query = f"{base} {set_clause}{where_clause}"
+            self._stmt_cache[cache_key] = update_query
+
+        vals = [keys_and_values[key] for key in update_keys]
+        cond_vals = [keys_and_values[cond] for cond in cond_keys]
+        self._row_buf.clear()
+        return self._crsr.execute(update_query, tuple(vals + cond_vals))
 
     def fetch(self, size: int = 1) -> Row | list[Row] | None:
         """Fetches the results from a SELECT query on the database
 
+        Fetching one row at a time reads 'prefetch_rows' rows ahead so a loop over
+        'fetch()' doesn't need a round trip to the server for every row
+
         Args:
             size (int, optional): How many row you want to fetch from the cursor. Defaults to 1.
 
@@ -177,32 +628,358 @@ class NREMCDatabaseConnector(object):
             Row | list[Row] | None: Either returns one row a list of Rows or none is size is less than one
         """
         if size == 1:
-            return self._crsr.fetchone()
+            buf = self._row_buf
+            if buf and self._crsr.description is self._buf_description:
+                return buf.popleft()
+            buf.clear()
+            buf.extend(self._crsr.fetchmany(self._prefetch))
+            self._buf_description = self._crsr.description
+            return buf.popleft() if buf else None
         elif size > 1:
-            return self._crsr.fetchmany(size)
+            rows = self._take_buffered(size)
+            if len(rows) < size:
+                rows.extend(self._crsr.fetchmany(size - len(rows)))
+            return rows
         return None
 
+    def _take_buffered(self, size: Optional[int] = None) -> list[Row]:
+        """Takes rows that 'fetch()' already read ahead out of the buffer
+
+        Args:
+            size (Optional[int], optional): Most rows to take. Defaults to taking all of them.
+
+        Returns:
+            list[Row]: Rows taken out of the buffer in order
+        """
+        # pyodbc makes a new description for every execute, so a different one means a
+        # query was run straight on the cursor and the buffered rows are from an old query
+        if self._crsr.description is not self._buf_description:
+            self._row_buf.clear()
+        if size is None or size >= len(self._row_buf):
+            rows = list(self._row_buf)
+            self._row_buf.clear()
+            return rows
+        return [self._row_buf.popleft() for _ in range(size)]
+
+    def fetch_batches(self, batch: Optional[int] = None) -> Iterator[list[Row]]:
+        """Fetches the results from a SELECT query a batch of rows at a time
+
+        Args:
+            batch (Optional[int], optional): How many rows to fetch per batch. Defaults to the cursors arraysize.
+
+        Yields:
+            list[Row]: Next batch of rows retrieved by the SQL command
+        """
+        if batch is None:
+            batch = self._crsr.arraysize
+        buffered = self._take_buffered()
+        if buffered:
+            yield buffered
+        while True:
+            rows = self._crsr.fetchmany(batch)
+            if not rows:
+                return
+            yield rows
+
+    def fetch_iter(self, batch_size: Optional[int] = None) -> Iterator[Row]:
+        """Lazily yields the rows from a SELECT query without loading them all into memory
+
+        Prefer this over 'fetch_all' for large queries, rows are fetched 'batch_size'
+        at a time so memory use stays the same no matter how many rows there are
+
+        Args:
+            batch_size (Optional[int], optional): How many rows to fetch per batch. Defaults to the cursors arraysize.
+
+        Yields:
+            Row: Next row retrieved by the SQL command
+        """
+        for rows in self.fetch_batches(batch_size):
+            yield from rows
+
     def fetch_all(self) -> list[Row]:
         """Fetches all queruered rows from a SQL command
 
         Returns:
             list[Row]: All row retrieved by SQL command
         """
-        return self._crsr.fetchall()
+        return self._take_buffered() + self._crsr.fetchall()
 
     def commit(self) -> None:
         """Commits any changes to the database making them perfect"""
-        self._crsr.commit()
+        self._conn.commit()
 
     def rollback(self) -> None:
         """Rolls back any non committed changes to the database"""
-        self._crsr.rollback()
+        self._conn.rollback()
+
+    @contextmanager
+    def transaction(self) -> Iterator["NREMCDatabaseConnector"]:
+        """Context manager that runs everything in the with block as one transaction
+
+        The changes are committed when the block finishes and rolled back if it raises.
+        Autocommit is turned off for the length of the block if it was on
+
+        Yields:
+            NREMCDatabaseConnector: This connector
+        """
+        autocommit = self._conn.autocommit
+        self._conn.autocommit = False
+        try:
+            yield self
+            self._conn.commit()
+        except BaseException:
+            self._conn.rollback()
+            raise
+        finally:
+            self._conn.autocommit = autocommit
 
     def set_command(self, identifier: str, command: str) -> None:
         """Sets a command by either creating a new command or updating a command
 
+        If the lowercase identifier is a valid method name that isn't already used by this class
+        a method is added that runs the command directly, e.g. 'db.select_person_by_id(1)' does
+        the same thing as 'db.call("SELECT_PERSON_BY_ID", 1)' without looking up the command
+
         Args:
             identifier (str): Command identifier for the command
             command (str): SQL command to run on the SQL server
         """
         self._cmds[identifier] = command
+
+        name = identifier.lower()
+        if (
+            name.isidentifier()
+            and not keyword.iskeyword(name)
+            and not name.startswith("_")
+            and not hasattr(type(self), name)
+        ):
+            def run(
+                *args: Any,
+                _sql: str = command,
+                _clear=self._row_buf.clear,
+                _execute=self._crsr.execute,
+            ) -> Cursor:
+                _clear()
+                return _execute(_sql, *args)
+
+            setattr(self, name, run)
+
+
+class NREMCDatabaseConnectorPool(object):
+    """Class that keeps a pool of open database connections to hand out.
+
+    Opening a connection to the SQL server is slow so instead of creating a new
+    NREMCDatabaseConnector every time, connections are kept open and reused
+
+    Attributes:
+        _server (str): Name of server to connect to
+        _database (str): Name of database to connect to
+        _version (int): Pyodbc driver version to use
+        _conn_str (str): Connection string used to open new connections
+        _cmds (Commands): Dictionary of command identifiers to predefined sql commands
+        _packet_size (int): Network packet size in bytes for new connections
+        _arraysize (int): Default batch size for 'fetchmany', 'fetch_batches' and 'fetch_iter'
+        _autocommit (bool): Whether new connections commit every statement as soon as it runs
+        _prefetch_rows (int): How many rows 'fetch()' reads ahead per round trip
+        _max_size (int): Most connections the pool will ever have open at once
+        _timeout (float): Seconds to wait for a connection when the pool is exhausted
+        _idle (deque[Connection]): Open connections waiting to be used
+        _size (int): Number of connections currently opened by the pool
+        _closed (bool): Whether 'close' has been called, connections given back after that are closed
+        _cond (threading.Condition): Guards '_idle', '_size' and '_closed' and wakes callers waiting for a connection
+    """
+
+    def __init__(
+        self,
+        server: str = ".",
+        database: str = "master",
+        version: int = 17,
+        cmds: Optional[Commands] = None,
+        packet_size: int = 32767,
+        arraysize: int = 1000,
+        autocommit: bool = False,
+        prefetch_rows: int = 100,
+        min_size: int = 1,
+        max_size: int = 10,
+        timeout: float = 30.0,
+    ) -> None:
+        """Creates the pool and opens 'min_size' connections to the sql server
+
+        Args:
+            server (str, optional): Name of server to connect to. Defaults to ".".
+            database (str, optional): Name of database to connect to. Defaults to "master".
+            version (int, optional): Pyodbc driver version to use. Defaults to 17.
+            cmds (Optional[Commands], optional): Dictionary of commands to use, it is copied. Defaults to None.
+            packet_size (int, optional): Network packet size in bytes for new connections. Defaults to 32767.
+            arraysize (int, optional): Default batch size for 'fetchmany', 'fetch_batches' and 'fetch_iter', it doesn't change how many rows the driver reads per network round trip. Defaults to 1000.
+            autocommit (bool, optional): Commit every statement as soon as it runs on new connections. Defaults to False.
+            prefetch_rows (int, optional): How many rows 'fetch()' reads ahead per round trip. Defaults to 100.
+            min_size (int, optional): Number of connections to open up front. Defaults to 1.
+            max_size (int, optional): Most connections the pool will have open at once. Defaults to 10.
+            timeout (float, optional): Seconds to wait for a free connection before giving up. Defaults to 30.0.
+
+        Raises:
+            ValueError: If the sizes are negative, 'min_size' is bigger than 'max_size' or 'prefetch_rows' is less than one
+        """
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError(
+                f"Invalid pool sizes min_size={min_size} and max_size={max_size}"
+            )
+        if prefetch_rows < 1:
+            raise ValueError(f"prefetch_rows must be at least 1 not {prefetch_rows}")
+        self._server = server
+        self._database = database
+        self._version = version
+        self._conn_str = _build_conn_str(server, database, version)
+        self._cmds: Commands = dict(cmds) if cmds else {}
+        self._packet_size = packet_size
+        self._arraysize = arraysize
+        self._autocommit = autocommit
+        self._prefetch_rows = prefetch_rows
+        self._max_size = max_size
+        self._timeout = timeout
+        self._idle: deque[Connection] = deque()
+        self._size = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+        for _ in range(min_size):
+            self._size += 1
+            self._idle.append(self._open())
+
+    def _open(self) -> Connection:
+        """Opens a new connection in a spot that was already reserved in '_size'
+
+        Returns:
+            Connection: Newly opened connection to the sql server
+        """
+        try:
+            return _connect(self._conn_str, self._packet_size, self._autocommit)
+        except Exception:
+            self._discard(None)
+            raise
+
+    def _discard(self, conn: Optional[Connection]) -> None:
+        """Closes a connection and frees up its spot in the pool
+
+        Args:
+            conn (Optional[Connection]): Connection to close if there is one
+        """
+        if conn is not None:
+            try:
+                conn.close()
+            except pyodbc.Error:
+                pass
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def _get(self) -> Connection:
+        """Gets an idle connection, opening a new one if the pool is not full yet
+
+        When the pool is full this waits until a connection is given back or one is
+        thrown away, which frees up a spot to open a new one
+
+        Raises:
+            TimeoutError: If no connection was freed up within the timeout
+
+        Returns:
+            Connection: Connection that is not being used by anyone else
+        """
+        deadline = time.monotonic() + self._timeout
+        with self._cond:
+            while True:
+                if self._idle:
+                    return self._idle.popleft()
+                if self._size < self._max_size:
+                    self._size += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(
+                        f"No database connection was freed up within {self._timeout} seconds"
+                    )
+                self._cond.wait(remaining)
+        return self._open()
+
+    @staticmethod
+    def _is_alive(conn: Connection) -> bool:
+        """Checks the connection still works by running a cheap query on it
+
+        Args:
+            conn (Connection): Connection to check
+
+        Returns:
+            bool: True if the server answered the query
+        """
+        try:
+            conn.execute("SELECT 1").fetchone()
+        except pyodbc.Error:
+            return False
+        return True
+
+    def _acquire_conn(self) -> Connection:
+        """Takes a working connection out of the pool, dropping any dead ones found along the way
+
+        Returns:
+            Connection: Open connection to the sql server
+        """
+        while True:
+            conn = self._get()
+            if self._is_alive(conn):
+                return conn
+            self._discard(conn)
+
+    def _release_conn(self, conn: Connection) -> None:
+        """Gives a connection back to the pool rolling back anything that was not committed
+
+        The connection is closed instead if the pool has already been closed
+
+        Args:
+            conn (Connection): Connection that was taken out with '_acquire_conn'
+        """
+        try:
+            conn.rollback()
+        except pyodbc.Error:
+            self._discard(conn)
+            return
+        with self._cond:
+            if not self._closed:
+                self._idle.append(conn)
+                self._cond.notify()
+                return
+        self._discard(conn)
+
+    @contextmanager
+    def acquire(self) -> Iterator[NREMCDatabaseConnector]:
+        """Context manager that lends out a NREMCDatabaseConnector backed by a pooled connection
+
+        The connection goes back into the pool when the with block exits and
+        anything that was not committed is rolled back
+
+        Yields:
+            NREMCDatabaseConnector: Connector using a connection from the pool
+        """
+        conn = self._acquire_conn()
+        try:
+            with NREMCDatabaseConnector(
+                self._server,
+                self._database,
+                self._version,
+                self._cmds,
+                conn=conn,
+                arraysize=self._arraysize,
+                prefetch_rows=self._prefetch_rows,
+            ) as db:
+                yield db
+        finally:
+            self._release_conn(conn)
+
+    def close(self) -> None:
+        """Closes every idle connection in the pool and any connection given back to it later"""
+        with self._cond:
+            self._closed = True
+            conns = list(self._idle)
+            self._idle.clear()
+        for conn in conns:
+            self._discard(conn)
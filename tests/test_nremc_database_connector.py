@@ -1,5 +1,6 @@
 import pytest
-from nremc_database_connector import NREMCDatabaseConnector
+import nremc_database_connector
+from nremc_database_connector import NREMCDatabaseConnector, NREMCDatabaseConnectorPool
 from pyodbc import Row
 
 @pytest.fixture
@@ -11,11 +12,32 @@ def test_call_one_person(database: NREMCDatabaseConnector) -> None:
     ret = database.fetch()
     assert isinstance(ret, Row)
     
+def test_generated_command_method(database: NREMCDatabaseConnector) -> None:
+    database.select_person_by_id(1)
+    ret = database.fetch()
+    assert isinstance(ret, Row)
+    
 def test_call_all_people(database: NREMCDatabaseConnector) -> None:
     database.call("SELECT_ALL_PEOPLE")
     ret = database.fetch_all()
     assert isinstance(ret, list) and len(ret) >= 1
     
+def test_fetch_iter_all_people(database: NREMCDatabaseConnector) -> None:
+    database.call("SELECT_ALL_PEOPLE")
+    expected = database.fetch_all()
+    database.call("SELECT_ALL_PEOPLE")
+    ret = list(database.fetch_iter(batch_size=1))
+    assert len(ret) == len(expected) and all(isinstance(row, Row) for row in ret)
+    
+def test_reading_cursor_keeps_prefetched_rows(database: NREMCDatabaseConnector) -> None:
+    database.call("SELECT_ALL_PEOPLE")
+    expected = database.fetch(2)
+    database.call("SELECT_ALL_PEOPLE")
+    first = database.fetch()
+    assert database.cursor.description is not None and database.cursor.rowcount is not None
+    second = database.fetch()
+    assert [first, second] == expected
+    
 def test_execute_many_cmd(database: NREMCDatabaseConnector) -> None:
     new_names_and_ages = (("Larsten Courtney", 8, 1), 
                         ("Adam", 7, 2), 
@@ -26,5 +48,94 @@ def test_execute_many_cmd(database: NREMCDatabaseConnector) -> None:
         pytest.fail("Database failed to execute call_many method...")
     finally:
         database.rollback()
-    
-    
\ No newline at end of file
+
+def test_fill_insert_cmd(database: NREMCDatabaseConnector) -> None:
+    try:
+        database.fill_insert("INSERT_PERSON_COLUMNS", {"name": "Cain", "age": 40})
+        database.fill_insert("INSERT_PERSON_COLUMNS", {"age": 38, "name": "Abel"})
+        assert database.cursor.rowcount == 1
+    finally:
+        database.rollback()
+
+def test_fill_update_cmd(database: NREMCDatabaseConnector) -> None:
+    try:
+        database.fill_update("UPDATE_PERSON", {"name": "Adam", "age": 7, "id": 2}, ["id"])
+        database.fill_update("UPDATE_PERSON", {"age": 8, "id": 2, "name": "Adam"}, ["id", "name"], ["AND"])
+        database.call("SELECT_PERSON_BY_ID", 2)
+        assert database.fetch().age == 8
+    finally:
+        database.rollback()
+
+def test_insert_many_cmd(database: NREMCDatabaseConnector) -> None:
+    new_people = [(f"Person {i}", i % 100) for i in range(2500)]
+    try:
+        database.insert_many("INSERT_PERSON", new_people)
+        database.call("SELECT_ALL_PEOPLE")
+        assert len(database.fetch_all()) >= len(new_people)
+    finally:
+        database.rollback()
+
+def test_bulk_insert(database: NREMCDatabaseConnector) -> None:
+    new_people = [(f"Person {i}", i % 100) for i in range(5000)]
+    try:
+        inserted = database.bulk_insert("[dbo].[People]", ["[name]", "[age]"], new_people)
+        assert inserted == len(new_people)
+    finally:
+        database.rollback()
+
+def test_transaction_rolls_back_on_error(database: NREMCDatabaseConnector) -> None:
+    database.call("SELECT_PERSON_BY_ID", 3)
+    before = database.fetch()
+    with pytest.raises(RuntimeError):
+        with database.transaction():
+            database.call("UPDATE_AGE_BY_ID", "Not Eve", 1, 3)
+            raise RuntimeError("Undo the update")
+    database.call("SELECT_PERSON_BY_ID", 3)
+    assert database.fetch() == before
+
+def test_pool_reuses_connection() -> None:
+    pool = NREMCDatabaseConnectorPool("TestBed1", "PythonTest", 17, 
+                                      {"SELECT_PERSON_BY_ID": "SELECT * FROM [dbo].[People] WHERE [id] = ?"},
+                                      min_size=1, max_size=1)
+    with pool.acquire() as db:
+        db.call("SELECT_PERSON_BY_ID", 1)
+        first_conn = db._conn
+    with pool.acquire() as db:
+        db.call("SELECT_PERSON_BY_ID", 1)
+        assert db._conn is first_conn and isinstance(db.fetch(), Row)
+    pool.close()
+
+def test_pick_driver_falls_back_to_older_version(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(nremc_database_connector, "_available_drivers",
+                        ["SQL Server", "ODBC Driver 13 for SQL Server", "ODBC Driver 17 for SQL Server"])
+    assert nremc_database_connector._pick_driver(18) == "ODBC Driver 17 for SQL Server"
+    assert nremc_database_connector._pick_driver(17) == "ODBC Driver 17 for SQL Server"
+    assert nremc_database_connector._pick_driver(13) == "ODBC Driver 13 for SQL Server"
+    assert nremc_database_connector._pick_driver(11) == "ODBC DRIVER 11 for SQL Server"
+
+def test_build_conn_str_is_cached(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(nremc_database_connector, "_available_drivers", ["ODBC Driver 17 for SQL Server"])
+    monkeypatch.setattr(nremc_database_connector, "_conn_str_cache", {})
+    conn_str = nremc_database_connector._build_conn_str("TestBed1", "PythonTest", 18)
+    assert conn_str.startswith("Driver={ODBC Driver 17 for SQL Server};SERVER=TestBed1;DATABASE=PythonTest;")
+    monkeypatch.setattr(nremc_database_connector, "_available_drivers", [])
+    assert nremc_database_connector._build_conn_str("TestBed1", "PythonTest", 18) is conn_str
+
+def test_prefetch_rows_must_be_positive() -> None:
+    with pytest.raises(ValueError):
+        NREMCDatabaseConnector(prefetch_rows=0)
+
+def test_fill_update_needs_a_column_to_set(database: NREMCDatabaseConnector) -> None:
+    with pytest.raises(ValueError):
+        database.fill_update("UPDATE_PERSON", {"id": 1}, ["id"])
+
+def test_arrow_params_only_take_text_safe_types() -> None:
+    from decimal import Decimal
+    from datetime import datetime
+    assert nremc_database_connector._arrow_param(None) is None
+    assert nremc_database_connector._arrow_param(True) == "1"
+    assert nremc_database_connector._arrow_param(12) == "12"
+    assert nremc_database_connector._arrow_param(Decimal("1E+3")) == "1000"
+    for bad in (b"bytes", 1.5, datetime(2023, 1, 1)):
+        with pytest.raises(TypeError):
+            nremc_database_connector._arrow_param(bad)